@@ -1,18 +1,20 @@
 from kmk.kmk_keyboard import KMKKeyboard
 from kmk.keys import KC
-from kmk.scanners import DiodeOrientation
+from kmk.kmktime import ticks_add, ticks_diff
+from kmk.scanners import Scanner
 from kmk.modules.encoder import EncoderHandler
-from kmk.modules.pn_mcp23017 import PN_MCP23017
+from keypad import Event as KeyEvent
+from adafruit_bus_device.i2c_device import I2CDevice
 
 import board
 import busio
 from neopixel import NeoPixel
 import displayio
 from adafruit_displayio_ssd1306 import SSD1306
-from adafruit_display_text import label
+from adafruit_display_text import bitmap_label
 import terminalio
-import time
 import supervisor
+import usb_cdc
 
 # --- Init Keyboard ---
 keyboard = KMKKeyboard()
@@ -21,26 +23,104 @@ keyboard = KMKKeyboard()
 i2c = busio.I2C(scl=board.GP7, sda=board.GP6)
 
 # --- Matrix on MCP23017 ---
-mcp = PN_MCP23017(i2c, address=0x20)
-keyboard.matrix = mcp.get_matrix(
-    rows=[0, 1, 2],
-    columns=[3, 4, 5],
-    diode_orientation=DiodeOrientation.COL2ROW
+# MCP23017 registers (IOCON.BANK = 0, so A/B pairs auto-increment)
+_IODIRA = 0x00
+_GPPUA = 0x0C
+_GPIOA = 0x12
+_OLATA = 0x14
+
+class MCP23017MatrixScanner(Scanner):
+    """Scan a COL2ROW matrix on an MCP23017, reading both GPIO ports at once"""
+    def __init__(self, i2c, rows, columns, address=0x20, offset=0):
+        self.device = I2CDevice(i2c, address)
+        self.rows = rows
+        self.columns = columns
+        self.offset = offset
+        self.prev_state = 0
+        self.col_mask = 0
+        for col in columns:
+            self.col_mask |= 1 << col
+        # Output latch values that pull one row low and leave the rest high
+        self.strobes = []
+        for row in rows:
+            self.strobes.append(self._pack(_OLATA, 0xFFFF & ~(1 << row)))
+        self._out = bytearray((_GPIOA,))
+        self._in = bytearray(2)
+
+        # Rows are outputs, columns are inputs with pull-ups
+        with self.device as dev:
+            dev.write(self._pack(_IODIRA, self.col_mask))
+            dev.write(self._pack(_GPPUA, self.col_mask))
+            dev.write(self._pack(_OLATA, 0xFFFF))
+
+    @staticmethod
+    def _pack(register, value):
+        return bytes((register, value & 0xFF, value >> 8))
+
+    @property
+    def key_count(self):
+        return len(self.rows) * len(self.columns)
+
+    def scan_for_changes(self):
+        state = 0
+        ba_idx = 0
+        with self.device as dev:
+            for strobe in self.strobes:
+                dev.write(strobe)
+                # One repeated-start read of GPIOA + GPIOB
+                dev.write_then_readinto(self._out, self._in)
+                pressed = ~(self._in[0] | self._in[1] << 8) & self.col_mask
+                for col in self.columns:
+                    if pressed & (1 << col):
+                        state |= 1 << ba_idx
+                    ba_idx += 1
+
+        changed = state ^ self.prev_state
+        if not changed:
+            return None
+
+        # Report one key per scan, the rest are picked up on the next scans
+        for key_number in range(ba_idx):
+            bit = 1 << key_number
+            if changed & bit:
+                self.prev_state ^= bit
+                return KeyEvent(key_number + self.offset, bool(state & bit))
+
+# Pins are MCP23017 bit numbers: 0-7 are GPA0-GPA7 and 8-15 are GPB0-GPB7.
+# On the PCB ROW1-3 are wired to GPB0-2 and COL1-3 to GPA0-2.
+keyboard.matrix = MCP23017MatrixScanner(
+    i2c,
+    rows=[8, 9, 10],
+    columns=[0, 1, 2],
+    address=0x20,
 )
 
 # --- Neopixel ---
 NUM_PIXELS = 9
-pixels = NeoPixel(board.GP26, NUM_PIXELS, brightness=0.4, auto_write=True)
+pixels = NeoPixel(board.GP26, NUM_PIXELS, brightness=0.4, auto_write=False)
 
 # --- OLED Setup ---
 displayio.release_displays()
 display_bus = displayio.I2CDisplay(i2c, device_address=0x3C)
 display = SSD1306(display_bus, width=128, height=32)
+# Refresh manually so only frames that actually changed go over I2C
+display.auto_refresh = False
 
 # Setup screen group
+# The text is rendered into a single bitmap once and scrolled by moving its group
+CHAR_WIDTH = terminalio.FONT.get_bounding_box()[0]
+# Whole characters that fit, the panel also shows part of one more
+VISIBLE_CHARS = display.width // CHAR_WIDTH
 main_group = displayio.Group()
-text_area = label.Label(terminalio.FONT, text="", scale=1, x=0, y=16)
-main_group.append(text_area)
+
+def font_safe(text):
+    """Replace characters terminalio.FONT has no glyph for, keeping every character CHAR_WIDTH wide"""
+    return "".join(c if terminalio.FONT.get_glyph(ord(c)) else "?" for c in text)
+
+scroll_group = displayio.Group()
+text_area = bitmap_label.Label(terminalio.FONT, text="", scale=1, x=0, y=16)
+scroll_group.append(text_area)
+main_group.append(scroll_group)
 display.show(main_group)
 
 # --- Encoder Setup ---
@@ -71,27 +151,78 @@ keyboard.keymap = [
     ]
 ]
 
+# --- Companion protocol ---
+# Each frame starts with a one byte opcode. 0x03 is skipped since it is Ctrl-C
+# on the console, and numeric fields are offset by FIELD_BIAS for the same reason.
+OP_VOLUME = 0x01
+OP_MEDIA = 0x02
+OP_STOP = 0x04
+FIELD_BIAS = 0x20
+
+# --- Timing ---
+SLEEP_DELAY_MS = 30000
+VOLUME_TIMEOUT_MS = 3000
+SCROLL_STEP_MS = 300
+
 # --- OLED Display Manager ---
 class OledManager:
-    def __init__(self, text_label):
+    def __init__(self, text_label, scroll_group):
         self.text_label = text_label
-        self.current_text = "CommandPad Ready"
-        self.last_vol_time = 0
+        self.scroll_group = scroll_group
+        self._set_text("CommandPad Ready")
+        now = supervisor.ticks_ms()
+        self.last_vol_time = now
         self.showing_volume = False
         self.scroll_offset = 0
-        self.scroll_pause = 0
+        self.scroll_pause = now
         self.display_on = True
         self.is_playing = False
-        self.last_activity = time.monotonic()
+        self.last_activity = now
+        self._next_deadline = now
+        self._last_scroll_text = None
+        self._last_scroll_offset = 0
+        self._last_vol_level = None
+        self._last_media = None
+
+    def _set_text(self, text):
+        """Set the song text and precompute the ring used for scrolling"""
+        # Measure the text that is rendered, so one character is one CHAR_WIDTH step
+        text = font_safe(text)
+        self.current_text = text
+        self._scrolls = len(text) > VISIBLE_CHARS
+        # The head is repeated after the gap, including the partly visible
+        # last cell, so wrapping back to offset 0 looks seamless
+        self._padded_text = text + "     " + text[:VISIBLE_CHARS + 1]
+        self._scroll_len = len(text) + 5
+        self.scroll_offset = 0
+
+    def _render(self, text, offset=0):
+        """Show text scrolled by offset characters, skipping the refresh if unchanged"""
+        if text == self._last_scroll_text and offset == self._last_scroll_offset:
+            return
+        if text != self._last_scroll_text:
+            # Rasterized once here, scrolling only moves the group
+            self.text_label.text = text
+            self._last_scroll_text = text
+        self.scroll_group.x = -offset * CHAR_WIDTH
+        self._last_scroll_offset = offset
+        # displayio only sends the label's dirty area, not the whole frame
+        display.refresh(minimum_frames_per_second=0)
 
     def set_volume(self, level):
+        # Repeats of the shown level (e.g. after a reconnect) need no re-render
+        if self.showing_volume and self.display_on and level == self._last_vol_level:
+            return
         if not self.display_on:
             self.wake_display()
-        self.text_label.text = f"🔊 Volume: {level}%"
-        self.last_vol_time = time.monotonic()
+        self._render(f"Volume: {level}%")
+        self._last_vol_level = level
+        now = supervisor.ticks_ms()
+        self.last_vol_time = now
         self.showing_volume = True
         self.scroll_offset = 0
-        self.last_activity = time.monotonic()
+        self.last_activity = now
+        self._next_deadline = now
 
     def set_media_info(self, title, artist="", is_playing=True):
         """Update media information from companion app"""
@@ -99,90 +230,171 @@ class OledManager:
         if is_playing:
             if not self.display_on:
                 self.wake_display()
-            if artist:
-                self.current_text = f"🎵 {artist} - {title}"
-            else:
-                self.current_text = f"🎵 {title}"
-            self.last_activity = time.monotonic()
+            if (title, artist) != self._last_media:
+                if artist:
+                    self._set_text(f"{artist} - {title}")
+                else:
+                    self._set_text(title)
+                self._last_media = (title, artist)
+            self.last_activity = supervisor.ticks_ms()
         else:
             # Nothing playing, turn off display after delay
             pass
+        self._next_deadline = supervisor.ticks_ms()
 
     def wake_display(self):
         """Wake up the display"""
         self.display_on = True
-        display.show(main_group)
+        display.wake()  # DISPLAYON, the root group never changes
 
     def sleep_display(self):
         """Turn off display when nothing is playing"""
         self.display_on = False
-        self.text_label.text = ""
-        display.show(displayio.Group())  # Show empty group
+        display.sleep()  # DISPLAYOFF, no refreshes are sent while asleep
 
     def tick(self):
-        now = time.monotonic()
+        now = supervisor.ticks_ms()
+
+        # Nothing is due yet, which is the case on almost every scan
+        if ticks_diff(now, self._next_deadline) < 0:
+            return
 
         # Auto-sleep display if nothing playing for 30 seconds
-        if not self.is_playing and now - self.last_activity > 30:
+        if not self.is_playing and ticks_diff(now, self.last_activity) >= SLEEP_DELAY_MS:
             if self.display_on:
                 self.sleep_display()
+            self._next_deadline = ticks_add(now, SLEEP_DELAY_MS)
             return
 
         # Show song title again after 3s
-        if self.showing_volume and now - self.last_vol_time > 3:
+        if self.showing_volume and ticks_diff(now, self.last_vol_time) >= VOLUME_TIMEOUT_MS:
             self.showing_volume = False
             self.scroll_offset = 0
-            self.scroll_pause = 0
+            self.scroll_pause = now
 
         # If showing song title, scroll if too long
         if not self.showing_volume and self.display_on:
-            full_text = self.current_text
-            visible_chars = 20
-            if len(full_text) <= visible_chars:
-                self.text_label.text = full_text
+            if not self._scrolls:
+                self._render(self.current_text)
             else:
-                if now - self.scroll_pause > 0.3:
-                    self.scroll_offset = (self.scroll_offset + 1) % (len(full_text) + 5)
+                if ticks_diff(now, self.scroll_pause) >= SCROLL_STEP_MS:
+                    self.scroll_offset += 1
+                    if self.scroll_offset == self._scroll_len:
+                        self.scroll_offset = 0
                     self.scroll_pause = now
-                padded = full_text + "     "
-                scroll_text = padded[self.scroll_offset:self.scroll_offset + visible_chars]
-                self.text_label.text = scroll_text
+                self._render(self._padded_text, self.scroll_offset)
+
+        # Sleep until the next volume revert, scroll step or auto-sleep
+        wait = SLEEP_DELAY_MS
+        if not self.is_playing:
+            wait = SLEEP_DELAY_MS - ticks_diff(now, self.last_activity)
+        if self.showing_volume:
+            wait = min(wait, VOLUME_TIMEOUT_MS - ticks_diff(now, self.last_vol_time))
+        elif self._scrolls and self.display_on:
+            wait = min(wait, SCROLL_STEP_MS - ticks_diff(now, self.scroll_pause))
+        self._next_deadline = ticks_add(now, max(wait, 0))
 
     def process_serial_data(self, data):
-        """Process data from companion application"""
-        try:
-            if data.startswith("VOL:"):
-                volume = int(data[4:])
-                self.set_volume(volume)
-            elif data.startswith("MEDIA:"):
-                # Format: MEDIA:playing|title|artist
-                parts = data[6:].split("|")
-                if len(parts) >= 2:
-                    is_playing = parts[0] == "1"
-                    title = parts[1]
-                    artist = parts[2] if len(parts) > 2 else ""
-                    self.set_media_info(title, artist, is_playing)
-            elif data.startswith("STOP"):
+        """Process frames from companion application, returns the number of bytes used"""
+        view = memoryview(data)
+        end = len(data)
+        pos = 0
+        while pos < end:
+            start = pos
+            op = data[pos]
+            if op == OP_VOLUME:
+                # Format: op, volume
+                if end - pos < 2:
+                    break
+                volume = data[pos + 1] - FIELD_BIAS
+                if volume < 0:
+                    pos += 1  # Not a real frame, resync on the next byte
+                else:
+                    self.set_volume(volume)
+                    pos += 2
+            elif op == OP_MEDIA:
+                # Format: op, playing, title length, title, artist length, artist
+                if end - pos < 4:
+                    break
+                title_len = data[pos + 2] - FIELD_BIAS
+                title_end = pos + 3 + title_len
+                if title_len >= 0 and title_end >= end:
+                    break
+                artist_len = data[title_end] - FIELD_BIAS if title_len >= 0 else -1
+                artist_end = title_end + 1 + artist_len
+                if artist_len >= 0 and artist_end > end:
+                    break
+                if artist_len < 0:
+                    pos += 1  # Not a real frame, resync on the next byte
+                else:
+                    try:
+                        title = str(view[pos + 3:title_end], "utf-8")
+                        artist = str(view[title_end + 1:artist_end], "utf-8")
+                        self.set_media_info(title, artist, data[pos + 1] != FIELD_BIAS)
+                    except:
+                        pass  # Ignore malformed text
+                    pos = artist_end
+            elif op == OP_STOP:
                 self.is_playing = False
-                self.current_text = "CommandPad Ready"
-        except:
-            pass  # Ignore malformed data
+                self._set_text("CommandPad Ready")
+                self._last_media = None
+                self._next_deadline = supervisor.ticks_ms()
+                pos += 1
+            else:
+                pos += 1  # Skip bytes until the next frame starts
+            assert pos > start, "serial parser did not advance"
+        return pos
+
+oled = OledManager(text_area, scroll_group)
 
-oled = OledManager(text_area)
+# --- LED Manager ---
+class LedManager:
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self._pixels_dirty = False
+
+    def set_pixel(self, index, color):
+        """Change one LED, sent with the next show()"""
+        self.pixels[index] = color
+        self._pixels_dirty = True
+
+    def fill(self, color):
+        """Change every LED, sent with the next show()"""
+        self.pixels.fill(color)
+        self._pixels_dirty = True
+
+    def show(self):
+        """Write the strip once if anything changed since the last call"""
+        if self._pixels_dirty:
+            self.pixels.show()
+            self._pixels_dirty = False
+
+leds = LedManager(pixels)
 
 # Volume level tracking
 volume_level = 50
 
 # Serial communication for companion app
+_rxbuf = bytearray()
+
+def drop_front(buf, count):
+    """Remove the first count bytes of a bytearray in place"""
+    # CircuitPython bytearrays support slice assignment but not del
+    buf[:] = buf[count:]
+
 def check_serial_input():
-    """Check for incoming serial data from companion application"""
+    """Drain pending serial data from the companion application without blocking"""
     try:
-        if supervisor.runtime.serial_bytes_available:
-            data = input().strip()
-            oled.process_serial_data(data)
-            return True
+        n = usb_cdc.console.in_waiting
+        if not n:
+            return False
+        _rxbuf.extend(usb_cdc.console.read(n))
+        used = oled.process_serial_data(_rxbuf)
+        if used:
+            drop_front(_rxbuf, used)
+        return True
     except:
-        pass
+        _rxbuf[:] = b""
     return False
 
 # Custom after_matrix_scan function
@@ -198,6 +410,9 @@ def custom_after_matrix_scan():
     # Update OLED display
     oled.tick()
 
+    # Push any LED changes made during this scan
+    leds.show()
+
 keyboard.after_matrix_scan = custom_after_matrix_scan
 
 # Hook encoder volume updates through key events
@@ -14,9 +14,11 @@ pip install pynput
 """
 
 import serial
+import struct
 import time
 import json
 import threading
+from queue import SimpleQueue, Empty
 import sys
 import traceback
 
@@ -24,9 +26,9 @@ import traceback
 import platform
 if platform.system() == "Windows":
     try:
-        from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+        from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume, IAudioEndpointVolumeCallback
         from ctypes import cast, POINTER
-        from comtypes import CLSCTX_ALL
+        from comtypes import CLSCTX_ALL, COMObject
         WINDOWS_AUDIO = True
     except ImportError:
         print("Windows audio libraries not found. Install: pip install pycaw comtypes")
@@ -43,20 +45,74 @@ else:
     WINDOWS_AUDIO = False
     WINDOWS_MEDIA = False
 
+if WINDOWS_AUDIO:
+    class VolumeCallback(COMObject):
+        """Receives endpoint volume change notifications from Windows"""
+        _com_interfaces_ = [IAudioEndpointVolumeCallback]
+
+        def __init__(self, companion):
+            super().__init__()
+            self.companion = companion
+
+        def OnNotify(self, pNotify):
+            self.companion.on_volume_changed(int(pNotify.contents.fMasterVolume * 100))
+
+# Frame opcodes understood by the macropad firmware. 0x03 is skipped since it is
+# Ctrl-C on the CircuitPython console, and numeric fields are offset by FIELD_BIAS
+# for the same reason.
+OP_VOLUME = 0x01
+OP_MEDIA = 0x02
+OP_STOP = 0x04
+FIELD_BIAS = 0x20
+
+def pack_volume(level):
+    """Build a volume frame (0-100)"""
+    return struct.pack("<BB", OP_VOLUME, level + FIELD_BIAS)
+
+def pack_media(title, artist, is_playing):
+    """Build a media frame, title and artist are sent as UTF-8"""
+    title_bytes = title.encode()
+    artist_bytes = artist.encode()
+    return (
+        struct.pack("<BBB", OP_MEDIA, int(is_playing) + FIELD_BIAS, len(title_bytes) + FIELD_BIAS)
+        + title_bytes
+        + struct.pack("<B", len(artist_bytes) + FIELD_BIAS)
+        + artist_bytes
+    )
+
+def pack_stop():
+    """Build a frame telling the macropad nothing is playing"""
+    return struct.pack("<B", OP_STOP)
+
+# How long the writer waits for more frames before writing a batch
+WRITE_BATCH_WINDOW = 0.02
+# Size of the reusable buffer a batch is copied into, far above one media frame
+TX_BUFFER_SIZE = 4096
+
 class CommandPadCompanion:
     def __init__(self, port="COM3", baudrate=115200):
         self.port = port
         self.baudrate = baudrate
         self.serial_conn = None
         self.running = False
+        self._txq = SimpleQueue()
+        self._txbuf = bytearray(TX_BUFFER_SIZE)
+        self._txview = memoryview(self._txbuf)
         
         # Audio monitoring
         self.last_volume = -1
         self.volume_endpoint = None
+        self.volume_callback = None
         
         # Media monitoring
-        self.last_media_info = {}
+        self._last_media_key = None
+        self.media_manager = None
         self.media_session = None
+        self._media_tokens = None
+        self._session_token = None
+        self._media_lock = None
+        self._media_tasks = set()
+        self._loop = None
         
         self.setup_audio()
         
@@ -74,29 +130,61 @@ class CommandPadCompanion:
         except Exception as e:
             print(f"Failed to initialize audio monitoring: {e}")
             
-    async def get_media_info(self):
-        """Get current media information (Windows only)"""
-        if not WINDOWS_MEDIA:
+    async def get_media_info(self, session):
+        """Get media of a session as a (title, artist, is_playing) tuple (Windows only)"""
+        if not WINDOWS_MEDIA or not session:
             return None
             
         try:
-            sessions = await MediaManager.request_async()
-            current_session = sessions.get_current_session()
+            info = await session.try_get_media_properties_async()
+            playback_info = session.get_playback_info()
             
-            if current_session:
-                info = await current_session.try_get_media_properties_async()
-                playback_info = current_session.get_playback_info()
-                
-                return {
-                    'title': info.title or "Unknown",
-                    'artist': info.artist or "",
-                    'is_playing': playback_info.playback_status == 4,  # Playing status
-                }
+            return (
+                info.title or "Unknown",
+                info.artist or "",
+                playback_info.playback_status == 4,  # Playing status
+            )
         except Exception as e:
             print(f"Media info error: {e}")
             
         return None
         
+    def start_volume_notifications(self):
+        """Send the current volume and subscribe to volume changes"""
+        if not self.volume_endpoint:
+            return
+
+        current_volume = self.get_volume_level()
+        if current_volume is not None:
+            self.on_volume_changed(current_volume)
+
+        try:
+            self.volume_callback = VolumeCallback(self)
+            self.volume_endpoint.RegisterControlChangeNotify(self.volume_callback)
+        except Exception as e:
+            print(f"Failed to register volume notifications: {e}")
+            self.volume_callback = None
+
+    def stop_volume_notifications(self):
+        """Unsubscribe from volume changes"""
+        if not self.volume_callback:
+            return
+
+        try:
+            self.volume_endpoint.UnregisterControlChangeNotify(self.volume_callback)
+        except Exception as e:
+            print(f"Failed to unregister volume notifications: {e}")
+        self.volume_callback = None
+
+    def on_volume_changed(self, current_volume):
+        """Forward a volume change to the macropad"""
+        if current_volume == self.last_volume:
+            return
+
+        self.send_to_macropad(pack_volume(current_volume))
+        self.last_volume = current_volume
+        print(f"Volume: {current_volume}%")
+
     def get_volume_level(self):
         """Get current system volume level (0-100)"""
         if not self.volume_endpoint:
@@ -112,76 +200,174 @@ class CommandPadCompanion:
     def connect_serial(self):
         """Connect to the macropad via serial"""
         try:
-            self.serial_conn = serial.Serial(self.port, self.baudrate, timeout=0.1)
+            # Reads never block (check in_waiting first and read(n)), and a
+            # stalled or unplugged port raises instead of hanging the writer
+            self.serial_conn = serial.Serial(
+                self.port, self.baudrate, timeout=0, write_timeout=0.05
+            )
             print(f"Connected to {self.port}")
             return True
         except Exception as e:
             print(f"Failed to connect to {self.port}: {e}")
             return False
             
-    def send_to_macropad(self, message):
-        """Send a message to the macropad"""
-        if not self.serial_conn:
+    def send_to_macropad(self, frame):
+        """Queue a frame for the macropad"""
+        self._txq.put(frame)
+            
+    def write_frames(self):
+        """Write queued frames to the macropad, one write per batch"""
+        while self.running:
+            try:
+                frames = [self._txq.get(timeout=0.5)]
+            except Empty:
+                continue
+                
+            # Let a burst of updates collect so it goes out in one transfer
+            time.sleep(WRITE_BATCH_WINDOW)
+            try:
+                while True:
+                    frames.append(self._txq.get_nowait())
+            except Empty:
+                pass
+                
+            # Only the latest volume matters when several are pending
+            last_volume = -1
+            for i, frame in enumerate(frames):
+                if frame[0] == OP_VOLUME:
+                    last_volume = i
+            
+            # Copy the batch into the reusable buffer instead of joining
+            size = 0
+            for i, frame in enumerate(frames):
+                if frame[0] == OP_VOLUME and i != last_volume:
+                    continue
+                if size + len(frame) > len(self._txbuf):
+                    self.write_buffer(size)
+                    size = 0
+                self._txbuf[size:size + len(frame)] = frame
+                size += len(frame)
+            self.write_buffer(size)
+            
+    def write_buffer(self, size):
+        """Write the first size bytes of the transmit buffer to the macropad"""
+        if not self.serial_conn or not size:
             return
             
         try:
-            self.serial_conn.write(f"{message}\\n".encode())
-            self.serial_conn.flush()
+            self.serial_conn.write(self._txview[:size])
         except Exception as e:
             print(f"Serial send error: {e}")
             
-    def monitor_volume(self):
-        """Monitor volume changes"""
-        while self.running:
+    def run_writer_thread(self):
+        """Run the serial writer in a separate thread"""
+        writer_thread = threading.Thread(target=self.write_frames)
+        writer_thread.daemon = True
+        writer_thread.start()
+        return writer_thread
+        
+    async def publish_media(self):
+        """Send the current media to the macropad if it changed"""
+        # Property and playback events usually fire together. The lock makes
+        # them read and compare in turn, so an older result never lands last
+        async with self._media_lock:
+            await self._publish_media()
+            
+    async def _publish_media(self):
+        try:
+            key = await self.get_media_info(self.media_session)
+            
+            if key and key != self._last_media_key:
+                self._last_media_key = key
+                title, artist, playing = key
+                title = title[:50]  # Limit length
+                artist = artist[:30]  # Limit length
+                self.send_to_macropad(pack_media(title, artist, playing))
+                
+                status = "Playing" if playing else "Paused"
+                print(f"Media ({status}): {artist} - {title}")
+                
+            elif not key:
+                # No media playing
+                if self._last_media_key:
+                    self.send_to_macropad(pack_stop())
+                    self._last_media_key = None
+                    print("No media playing")
+        except Exception as e:
+            print(f"Media monitoring error: {e}")
+            
+    def watch_session(self, session):
+        """Move the media change handlers to a new session"""
+        if self.media_session and self._media_tokens:
+            props_token, playback_token = self._media_tokens
             try:
-                current_volume = self.get_volume_level()
-                if current_volume is not None and current_volume != self.last_volume:
-                    self.send_to_macropad(f"VOL:{current_volume}")
-                    self.last_volume = current_volume
-                    print(f"Volume: {current_volume}%")
-                    
-                time.sleep(0.5)  # Check every 500ms
+                self.media_session.remove_media_properties_changed(props_token)
+                self.media_session.remove_playback_info_changed(playback_token)
             except Exception as e:
-                print(f"Volume monitoring error: {e}")
-                time.sleep(1)
-                
-    async def monitor_media(self):
-        """Monitor media changes"""
+                print(f"Failed to unsubscribe from media session: {e}")
+        self.media_session = session
+        self._media_tokens = None
+        
+        if session:
+            self._media_tokens = (
+                session.add_media_properties_changed(self._on_media_changed),
+                session.add_playback_info_changed(self._on_media_changed),
+            )
+            
+    def _on_session_changed(self, sender, args):
+        # Called on a WinRT thread, hand the work to the event loop
+        self._loop.call_soon_threadsafe(self._start_media_task, self._switch_session)
+        
+    def _on_media_changed(self, sender, args):
+        # Called on a WinRT thread, hand the work to the event loop
+        self._loop.call_soon_threadsafe(self._start_media_task, self.publish_media)
+        
+    def _start_media_task(self, coro_func):
+        # Keep a reference so the task is not garbage collected while it runs
+        task = asyncio.ensure_future(coro_func())
+        self._media_tasks.add(task)
+        task.add_done_callback(self._media_tasks.discard)
+        
+    async def _switch_session(self):
+        self.watch_session(self.media_manager.get_current_session())
+        await self.publish_media()
+        
+    async def connect_media(self):
+        """Get the media session manager and subscribe to session changes"""
         while self.running:
             try:
-                media_info = await self.get_media_info()
-                
-                if media_info and media_info != self.last_media_info:
-                    is_playing = 1 if media_info['is_playing'] else 0
-                    title = media_info['title'][:50]  # Limit length
-                    artist = media_info['artist'][:30]  # Limit length
-                    
-                    message = f"MEDIA:{is_playing}|{title}|{artist}"
-                    self.send_to_macropad(message)
-                    self.last_media_info = media_info
-                    
-                    status = "Playing" if media_info['is_playing'] else "Paused"
-                    print(f"Media ({status}): {artist} - {title}")
-                    
-                elif not media_info:
-                    # No media playing
-                    if self.last_media_info:
-                        self.send_to_macropad("STOP")
-                        self.last_media_info = {}
-                        print("No media playing")
-                        
-                await asyncio.sleep(1)  # Check every second
+                media_manager = await MediaManager.request_async()
+                self._session_token = media_manager.add_current_session_changed(
+                    self._on_session_changed
+                )
+                self.media_manager = media_manager
+                return
             except Exception as e:
                 print(f"Media monitoring error: {e}")
                 await asyncio.sleep(2)
                 
-    def run_volume_thread(self):
-        """Run volume monitoring in a separate thread"""
-        volume_thread = threading.Thread(target=self.monitor_volume)
-        volume_thread.daemon = True
-        volume_thread.start()
-        return volume_thread
-        
+    async def monitor_media(self):
+        """Subscribe to media session events until the app is stopped"""
+        self._loop = asyncio.get_running_loop()
+        self._media_lock = asyncio.Lock()
+        await self.connect_media()
+        if not self.media_manager:
+            return
+            
+        try:
+            self.watch_session(self.media_manager.get_current_session())
+            await self.publish_media()
+            
+            # Updates arrive through the event handlers, so just wait here
+            # until the task is cancelled (Ctrl+C)
+            await asyncio.Event().wait()
+        finally:
+            try:
+                self.media_manager.remove_current_session_changed(self._session_token)
+            except Exception as e:
+                print(f"Failed to unsubscribe from media sessions: {e}")
+            self.watch_session(None)
+            
     async def run_async(self):
         """Run the companion app with async media monitoring"""
         self.running = True
@@ -193,8 +379,8 @@ class CommandPadCompanion:
         print("Starting monitoring...")
         print("Press Ctrl+C to stop")
         
-        # Start volume monitoring thread
-        volume_thread = self.run_volume_thread()
+        self.run_writer_thread()
+        self.start_volume_notifications()
         
         try:
             # Run media monitoring
@@ -203,6 +389,7 @@ class CommandPadCompanion:
             print("\\nShutting down...")
         finally:
             self.running = False
+            self.stop_volume_notifications()
             if self.serial_conn:
                 self.serial_conn.close()
                 
@@ -222,7 +409,8 @@ class CommandPadCompanion:
             print("Starting volume monitoring only...")
             print("Press Ctrl+C to stop")
             
-            volume_thread = self.run_volume_thread()
+            self.run_writer_thread()
+            self.start_volume_notifications()
             
             try:
                 while self.running:
@@ -231,27 +419,22 @@ class CommandPadCompanion:
                 print("\\nShutting down...")
             finally:
                 self.running = False
+                self.stop_volume_notifications()
                 if self.serial_conn:
                     self.serial_conn.close()
 
+# USB vendor IDs CircuitPython reports on the XIAO RP2040: Seeed's own build,
+# and Adafruit's for the Pico build
+MACROPAD_USB_VIDS = (0x2886, 0x239A)
+
 def find_macropad_port():
     """Try to auto-detect the macropad's serial port"""
     import serial.tools.list_ports
     
-    ports = serial.tools.list_ports.comports()
-    for port in ports:
-        # Look for CircuitPython devices
-        if "CircuitPython" in str(port.description) or "CDC" in str(port.description):
+    # Match on the USB descriptors so no port has to be opened
+    for port in serial.tools.list_ports.comports():
+        if port.vid in MACROPAD_USB_VIDS or "CircuitPython" in str(port.description):
             return port.device
-    
-    # Fallback to common Windows ports
-    for port_name in ["COM3", "COM4", "COM5", "COM6"]:
-        try:
-            test_conn = serial.Serial(port_name, 115200, timeout=0.1)
-            test_conn.close()
-            return port_name
-        except:
-            continue
             
     return None
 
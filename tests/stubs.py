@@ -0,0 +1,66 @@
+"""Load the firmware and companion app on a desktop Python for tests.
+
+The firmware only runs on CircuitPython and the companion needs pyserial,
+so the modules they import are replaced with stubs while they are loaded.
+"""
+
+import functools
+import importlib.util
+import os
+import sys
+import types
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def _load(name, path, stubs):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, stubs):
+        spec.loader.exec_module(module)
+    return module
+
+
+@functools.lru_cache(maxsize=None)
+def load_firmware():
+    """Import Firmware/main.py with CircuitPython and KMK modules stubbed out"""
+    stubs = {}
+    for name in [
+        "kmk", "kmk.kmk_keyboard", "kmk.keys", "kmk.modules", "kmk.modules.encoder",
+        "keypad", "adafruit_bus_device", "adafruit_bus_device.i2c_device",
+        "board", "busio", "neopixel", "displayio", "adafruit_displayio_ssd1306",
+        "adafruit_display_text", "usb_cdc",
+    ]:
+        stubs[name] = mock.MagicMock()
+    stubs["adafruit_displayio_ssd1306"].SSD1306.return_value.width = 128
+
+    scanners = types.ModuleType("kmk.scanners")
+    scanners.Scanner = type("Scanner", (), {})
+    stubs["kmk.scanners"] = scanners
+
+    terminalio = types.ModuleType("terminalio")
+    terminalio.FONT = mock.MagicMock()
+    terminalio.FONT.get_bounding_box.return_value = (6, 12)
+    stubs["terminalio"] = terminalio
+
+    kmktime = types.ModuleType("kmk.kmktime")
+    kmktime.ticks_add = lambda ticks, delta: ticks + delta
+    kmktime.ticks_diff = lambda ticks1, ticks2: ticks1 - ticks2
+    stubs["kmk.kmktime"] = kmktime
+
+    supervisor = types.ModuleType("supervisor")
+    supervisor.ticks_ms = lambda: 0
+    stubs["supervisor"] = supervisor
+
+    return _load("commandpad_firmware", os.path.join(ROOT, "Firmware", "main.py"), stubs)
+
+
+@functools.lru_cache(maxsize=None)
+def load_companion():
+    """Import companion_app.py with pyserial stubbed out"""
+    return _load(
+        "commandpad_companion",
+        os.path.join(ROOT, "companion_app.py"),
+        {"serial": mock.MagicMock()},
+    )
@@ -0,0 +1,58 @@
+"""Batching of queued frames in the companion's serial writer."""
+
+import threading
+import unittest
+
+from stubs import load_companion
+
+companion = load_companion()
+
+
+class FakeSerial:
+    def __init__(self):
+        self.writes = []
+        self.written = threading.Event()
+
+    def write(self, data):
+        # The writer reuses its buffer, so keep a copy
+        self.writes.append(bytes(data))
+        self.written.set()
+
+
+class WriteFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = companion.CommandPadCompanion("TEST")
+        self.app.serial_conn = FakeSerial()
+
+    def run_writer(self, frames):
+        """Queue frames before the writer starts, so they form one batch"""
+        for frame in frames:
+            self.app.send_to_macropad(frame)
+        self.app.running = True
+        thread = self.app.run_writer_thread()
+        self.assertTrue(self.app.serial_conn.written.wait(2))
+        self.app.running = False
+        thread.join(2)
+        return self.app.serial_conn.writes
+
+    def test_batch_keeps_only_latest_volume(self):
+        media = companion.pack_media("Song", "Artist", True)
+        writes = self.run_writer([
+            companion.pack_volume(10),
+            companion.pack_volume(20),
+            media,
+            companion.pack_volume(30),
+            companion.pack_stop(),
+        ])
+        self.assertEqual(writes, [media + companion.pack_volume(30) + companion.pack_stop()])
+
+    def test_batch_larger_than_buffer_is_chunked(self):
+        self.app._txbuf = bytearray(16)
+        self.app._txview = memoryview(self.app._txbuf)
+        media = companion.pack_media("Title", "Artist", True)  # 14 bytes
+        writes = self.run_writer([media, media, companion.pack_stop()])
+        self.assertEqual(writes, [media, media + companion.pack_stop()])
+
+
+if __name__ == "__main__":
+    unittest.main()
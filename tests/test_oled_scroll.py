@@ -0,0 +1,39 @@
+"""Scrolling of long titles on the firmware's OLED."""
+
+import unittest
+from unittest import mock
+
+from stubs import load_firmware
+
+firmware = load_firmware()
+
+
+class ScrollRingTest(unittest.TestCase):
+    def setUp(self):
+        font = firmware.terminalio.FONT
+        font.get_glyph.side_effect = lambda codepoint: object() if codepoint < 128 else None
+        self.addCleanup(setattr, font.get_glyph, "side_effect", None)
+        self.oled = firmware.OledManager(mock.MagicMock(), mock.MagicMock())
+
+    def test_ring_uses_renderable_text(self):
+        self.oled._set_text("\U0001F3B5 Артист - A rather long song title")
+        text = self.oled.current_text
+        self.assertTrue(all(ord(c) < 128 for c in text))
+        self.assertTrue(self.oled._scrolls)
+        # One full period of the ring brings the head back into view
+        ring = self.oled._padded_text
+        period = self.oled._scroll_len
+        self.assertEqual(ring[period:], text[:firmware.VISIBLE_CHARS + 1])
+        self.assertEqual(ring[:period], text + "     ")
+
+    def test_window_matches_display(self):
+        # 128 px at 6 px per character shows 21 whole characters
+        self.assertEqual(firmware.VISIBLE_CHARS, 21)
+        self.oled._set_text("x" * 21)
+        self.assertFalse(self.oled._scrolls)
+        self.oled._set_text("x" * 22)
+        self.assertTrue(self.oled._scrolls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Frames built by the companion app, parsed by the firmware."""
+
+import unittest
+from unittest import mock
+
+from stubs import load_companion, load_firmware
+
+firmware = load_firmware()
+companion = load_companion()
+pack_volume = companion.pack_volume
+pack_media = companion.pack_media
+pack_stop = companion.pack_stop
+
+
+class ProcessSerialDataTest(unittest.TestCase):
+    def setUp(self):
+        self.oled = firmware.OledManager(mock.MagicMock(), mock.MagicMock())
+        self.events = []
+        self.oled.set_volume = lambda level: self.events.append(("vol", level))
+        self.oled.set_media_info = lambda title, artist, playing: self.events.append(
+            ("media", title, artist, playing)
+        )
+
+    def feed(self, chunks):
+        """Feed chunks the way check_serial_input does, returns the leftover buffer"""
+        rxbuf = bytearray()
+        for chunk in chunks:
+            rxbuf.extend(chunk)
+            used = self.oled.process_serial_data(rxbuf)
+            if used:
+                firmware.drop_front(rxbuf, used)
+        return rxbuf
+
+    def test_well_formed_frames(self):
+        data = pack_volume(3) + pack_media("Ünïcode song", "Artist", True) + pack_volume(100) + pack_stop()
+        self.oled.is_playing = True
+
+        self.assertEqual(self.feed([data]), bytearray())
+        self.assertEqual(self.events, [
+            ("vol", 3),
+            ("media", "Ünïcode song", "Artist", True),
+            ("vol", 100),
+        ])
+        self.assertFalse(self.oled.is_playing)
+
+    def test_paused_media_without_artist(self):
+        self.feed([pack_media("Title", "", False)])
+        self.assertEqual(self.events, [("media", "Title", "", False)])
+
+    def test_longest_multibyte_title(self):
+        # The companion sends at most 50 characters, 4 UTF-8 bytes each
+        title = "\U0001F3B5" * 50
+        frame = pack_media(title, "Artist", True)
+        self.assertEqual(frame[2], 200 + companion.FIELD_BIAS)
+        self.assertEqual(self.feed([frame]), bytearray())
+        self.assertEqual(self.events, [("media", title, "Artist", True)])
+
+    def test_split_frames(self):
+        data = pack_volume(42) + pack_media("Song title", "Someone", True)
+        self.assertEqual(self.feed([data[i:i + 1] for i in range(len(data))]), bytearray())
+        self.assertEqual(self.events, [("vol", 42), ("media", "Song title", "Someone", True)])
+
+    def test_incomplete_frame_is_kept(self):
+        data = pack_volume(9) + pack_media("Song title", "Someone", True)
+        self.assertEqual(self.feed([data[:-2]]), bytearray(data[2:-2]))
+        self.assertEqual(self.events, [("vol", 9)])
+
+    def test_negative_lengths_do_not_hang(self):
+        leftover = self.feed([b"\x20" * 40 + b"\x02\x21\x00\x00"])
+        self.assertEqual(leftover, bytearray())
+        self.assertEqual(self.events, [])
+
+    def test_corrupt_bytes_resync_to_next_frame(self):
+        garbage = b"\x02\x21\x25hi\x05" + b"\x01\x00" + b"\x02\x20\x20\x10"
+        leftover = self.feed([garbage + pack_volume(7) + pack_media("A", "B", True)])
+        self.assertEqual(leftover, bytearray())
+        self.assertIn(("vol", 7), self.events)
+        self.assertEqual(self.events[-1], ("media", "A", "B", True))
+
+
+if __name__ == "__main__":
+    unittest.main()